@@ -1,141 +1,705 @@
+import asyncio
+import inspect
+import os
+import threading
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from openai import AsyncOpenAI
+
+# Model used for all generation calls. Point the client at a self-hosted OpenAI-compatible server
+# (e.g. vLLM with --enable-prefix-caching) and set this to its model name to reuse KV caches of
+# repeated prompt prefixes on that server.
+LLM_MODEL = "gpt-4.1"
+
+# Maximum number of in-flight OpenAI requests per event loop, to stay clear of 429s
+MAX_CONCURRENT_REQUESTS = 6
+
+# Cache of generated hypothetical answers / related queries per question.
+# Off by default so evaluation runtimes include the generation calls.
+GENERATION_CACHE_ENABLED = False
+GENERATION_CACHE_SIZE = 1024
+
+# Chunks retrieved per query in multiple_queries_rag; retrieved chunks with cosine similarity above
+# NEAR_DUPLICATE_THRESHOLD to an earlier one are dropped before cross-encoder re-ranking
+RESULTS_PER_QUERY = 5
+NEAR_DUPLICATE_THRESHOLD = 0.95
+
+# Re-ranking score penalty per log-character of chunk length
+LENGTH_PENALTY = 0.01
+
+# Cache of cross-encoder scores per (question, chunk).
+# Off by default so evaluation runtimes include re-ranking.
+CROSS_ENCODER_CACHE_ENABLED = False
+CROSS_ENCODER_CACHE_SIZE = 100_000
+
+# Semantic answer cache: reuse an answer when a new question's embedding has cosine similarity
+# above the threshold with a previously answered question (oldest entries evicted first).
+# Off by default so evaluation runtimes measure real retrieval and generation.
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_THRESHOLD = 0.97
+SEMANTIC_CACHE_SIZE = 10_000
+
+# Cross-encoder batch size; pairs are length-sorted before batching so little compute goes to padding
+CROSS_ENCODER_BATCH_SIZE = 16
+
+# Instructions for the final answer. Kept byte-identical and at the start of every prompt so the
+# provider's prompt cache can match on the prefix; the variable context and question follow it.
+STATIC_SYSTEM_PROMPT = """You are a helpful expert financial research assistant answering questions using excerpts from the TCS Annual Report.
+
+Please provide a clear, accurate answer based only on the information provided in the excerpts. If the context doesn't contain enough information to fully answer the question, please say so."""
+
+_request_semaphores = weakref.WeakKeyDictionary()
+
+
+class _LRUCache:
+    """Thread-safe least-recently-used cache backed by an OrderedDict"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _SemanticCache:
+    """FIFO cache of results keyed by question embeddings (stored unit-normalized), matched by cosine similarity"""
+
+    def __init__(self, threshold, maxsize):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self._embeddings = None
+        self._results = []
+        self._lock = threading.Lock()
+
+    def get(self, embedding):
+        with self._lock:
+            if self._embeddings is None or self._embeddings.shape[1] != embedding.shape[0]:
+                return None
+            scores = self._embeddings @ (embedding / np.linalg.norm(embedding))
+            best = int(np.argmax(scores))
+            return self._results[best] if scores[best] > self.threshold else None
+
+    def put(self, embedding, result):
+        embedding = embedding / np.linalg.norm(embedding)
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = embedding[np.newaxis, :]
+            elif self._embeddings.shape[1] != embedding.shape[0]:
+                return
+            else:
+                self._embeddings = np.vstack([self._embeddings, embedding])
+            self._results.append(result)
+
+            if len(self._results) > self.maxsize:
+                self._embeddings = self._embeddings[1:]
+                self._results.pop(0)
+
+    def clear(self):
+        with self._lock:
+            self._embeddings = None
+            self._results = []
+
+
+_hypothetical_answer_cache = _LRUCache(GENERATION_CACHE_SIZE)
+_related_queries_cache = _LRUCache(GENERATION_CACHE_SIZE)
+# Cross-encoder score caches per model object, dropped when the model is freed
+_cross_encoder_score_caches = weakref.WeakKeyDictionary()
+_cross_encoder_score_caches_lock = threading.Lock()
+# Semantic answer caches per collection: id(chroma_collection) -> {(method, LLM_MODEL): _SemanticCache}.
+# Keyed by id() because Chroma collections define __eq__ without __hash__; each entry is removed when its
+# collection is freed, so a reused id never sees another collection's answers.
+_answer_caches = {}
+_answer_caches_lock = threading.Lock()
+
+
+def _normalize_question(question):
+    """Cache key for a question: whitespace-trimmed and lowercased"""
+    return question.strip().lower()
+
+
+def cache_clear():
+    """Clear all module-level caches (e.g. between evaluation runs or in tests)"""
+    _hypothetical_answer_cache.clear()
+    _related_queries_cache.clear()
+    with _cross_encoder_score_caches_lock:
+        _cross_encoder_score_caches.clear()
+    with _answer_caches_lock:
+        _answer_caches.clear()
+
+
+def _answer_cache(chroma_collection, method):
+    """Semantic answer cache for this collection, RAG method and generation model"""
+    key = id(chroma_collection)
+    with _answer_caches_lock:
+        if key not in _answer_caches:
+            _answer_caches[key] = {}
+            weakref.finalize(chroma_collection, _answer_caches.pop, key, None)
+        caches = _answer_caches[key]
+        if (method, LLM_MODEL) not in caches:
+            caches[(method, LLM_MODEL)] = _SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+        return caches[(method, LLM_MODEL)]
+
+
+async def _embed_question(chroma_collection, question):
+    """
+    Embed the question with the collection's embedding function, for cache lookup and as the query embedding
+    Returns: embedding (np.ndarray), or None if the collection has no embedding function
+    """
+    embedding_function = getattr(chroma_collection, "_embedding_function", None)
+    if embedding_function is None:
+        return None
 
+    embeddings = await asyncio.to_thread(embedding_function, [question])
+    return np.asarray(embeddings[0], dtype=np.float32)
 
-def basic_rag(question, chroma_collection, client):
+
+def _cached_answer(cached, start_time):
+    """Stream a semantically cached result, with the runtime of the current call and fresh copies of list fields"""
+    metadata = {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in cached.items() if key != "answer"
+    }
+    return _stream_text(cached["answer"], start_time, metadata)
+
+
+def _request_slot():
+    """Semaphore limiting concurrent OpenAI requests on the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _request_semaphores:
+        _request_semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    return _request_semaphores[loop]
+
+
+async def _create_response(client, prompt):
     """
-    Basic RAG: retrieve 5 chunks, generate answer with GPT-4.1
-    Returns: {"answer": str, "runtime": float}
+    Generate a response with LLM_MODEL using either an AsyncOpenAI or a sync OpenAI client
+    Returns: response text (str)
     """
-    start_time = time.time()
+    async with _request_slot():
+        if isinstance(client, AsyncOpenAI) or inspect.iscoroutinefunction(client.responses.create):
+            response = await client.responses.create(model=LLM_MODEL, input=prompt)
+        else:
+            # Sync client: run the blocking call off the event loop
+            response = await asyncio.to_thread(client.responses.create, model=LLM_MODEL, input=prompt)
 
-    # Retrieve 5 most relevant chunks
-    results = chroma_collection.query(query_texts=[question], n_results=5)
+    return response.output_text if hasattr(response, 'output_text') else str(response)
 
-    if not results['documents'][0]:
-        runtime = time.time() - start_time
-        return {
-            "answer": "No relevant information found in TCS report.",
-            "runtime": round(runtime, 2)
-        }
 
-    # Combine chunks into context
-    context = "\n\n".join(results['documents'][0])
+async def _stream_response(client, prompt):
+    """
+    Stream an LLM_MODEL response using either an AsyncOpenAI or a sync OpenAI client
+    Yields: response text deltas (str)
+    """
+    async with _request_slot():
+        if isinstance(client, AsyncOpenAI) or inspect.iscoroutinefunction(client.responses.create):
+            stream = await client.responses.create(model=LLM_MODEL, input=prompt, stream=True)
+            try:
+                async for event in stream:
+                    if event.type == "response.output_text.delta":
+                        yield event.delta
+                    elif event.type == "error":
+                        raise RuntimeError(event.message)
+            finally:
+                # Release the HTTP response even if the consumer stops early or an error event is raised
+                await stream.close()
+        else:
+            # Sync client: pull each event off the event loop
+            stream = await asyncio.to_thread(client.responses.create, model=LLM_MODEL, input=prompt, stream=True)
+            try:
+                done = object()
+                while (event := await asyncio.to_thread(next, stream, done)) is not done:
+                    if event.type == "response.output_text.delta":
+                        yield event.delta
+                    elif event.type == "error":
+                        raise RuntimeError(event.message)
+            finally:
+                stream.close()
+
+
+def _result(answer, start_time, metadata):
+    """Result dict for an answer, with the runtime since start_time (a time.perf_counter() value)"""
+    return {
+        "answer": answer,
+        "runtime": round(time.perf_counter() - start_time, 2),
+        **metadata
+    }
+
+
+def _stream_answer(client, prompt, start_time, metadata, on_success=None):
+    """
+    Stream the final answer for a prompt; on_success(result) is called if the answer was generated without error
+    If the API fails, the error message is streamed on its own line after any partial answer, and the result's
+    answer is that same text (partial answer, blank line, error), so stream and result agree
+    Returns: (async iterator of answer text chunks, future resolved with the result dict once the stream is exhausted)
+    """
+    result = asyncio.get_running_loop().create_future()
 
-    # Generate answer with GPT-4.1
-    try:
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=f"""Based on the following excerpts from the TCS Annual Report, please answer this question: {question}
+    async def stream():
+        try:
+            pieces = []
+            try:
+                async for delta in _stream_response(client, prompt):
+                    pieces.append(delta)
+                    yield delta
+                answer = "".join(pieces).strip()
+                succeeded = True
+            except Exception as e:
+                error = f"Error calling OpenAI API: {str(e)}"
+                partial_answer = "".join(pieces).strip()
+                answer = f"{partial_answer}\n\n{error}" if partial_answer else error
+                succeeded = False
+                yield f"\n\n{error}" if pieces else error
+
+            if succeeded and on_success is not None:
+                on_success({"answer": answer, **metadata})
+
+            result.set_result(_result(answer, start_time, metadata))
+        finally:
+            if not result.done():
+                result.cancel()
+
+    return stream(), result
+
+
+def _stream_text(answer, start_time, metadata):
+    """
+    Stream a fixed answer (e.g. when no chunks were retrieved)
+    Returns: (async iterator yielding the answer once, future already resolved with the result dict)
+    """
+    result = asyncio.get_running_loop().create_future()
+    result.set_result(_result(answer, start_time, metadata))
 
-Context from TCS Annual Report:
-{context}
+    async def stream():
+        yield answer
 
-Please provide a clear, accurate answer based only on the information provided above. If the context doesn't contain enough information to fully answer the question, please say so."""
-        )
+    return stream(), result
+
+
+def _cache_answer(answer_cache, question_embedding):
+    """
+    on_success callback storing a generated result in the semantic answer cache
+    List fields are stored as tuples so callers mutating their result can't change the cached one
+    """
+    if question_embedding is None:
+        return None
+    return lambda result: answer_cache.put(question_embedding, {
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in result.items()
+    })
 
-        answer = response.output_text if hasattr(response, 'output_text') else str(response)
-        runtime = time.time() - start_time
 
-        return {
-            "answer": answer.strip(),
-            "runtime": round(runtime, 2)
-        }
+async def _collect(stream, result):
+    """Consume an answer stream and return its result dict"""
+    async for _ in stream:
+        pass
+    return await result
 
-    except Exception as e:
-        runtime = time.time() - start_time
-        return {
-            "answer": f"Error calling OpenAI API: {str(e)}",
-            "runtime": round(runtime, 2)
-        }
 
+def optimize_cross_encoder(cross_encoder):
+    """
+    Prepare a sentence-transformers CrossEncoder for fast re-ranking: fp16 weights when it runs on CUDA
+    Returns: the same cross_encoder, converted in place
+    """
+    if str(getattr(cross_encoder, "device", "cpu")).startswith("cuda"):
+        cross_encoder.model.half()
+    return cross_encoder
 
-def query_expansion_rag(question, chroma_collection, client):
+
+def initialize(chroma_collection, cross_encoder=None, num_threads=None):
     """
-    Query Expansion RAG: generate hypothetical answer, combine with question, retrieve 5 chunks
-    Returns: {"answer": str, "runtime": float, "hypothetical_answer": str}
+    Warm up the models once at startup so the first question doesn't pay for model loading.
+    Sets torch's CPU thread count (default: half the cores), runs a warmup query through the collection's
+    embedding function and, if given, prepares the cross-encoder and runs one prediction.
+    For async (HTTP) collections use initialize_async.
     """
-    start_time = time.time()
+    _check_sync_collection(chroma_collection, "initialize_async")
+    _set_num_threads(num_threads)
+    chroma_collection.query(query_texts=["warmup"], n_results=1)
+    _warm_up_cross_encoder(cross_encoder)
 
-    # Step 1: Generate hypothetical answer
-    try:
-        hyp_response = client.responses.create(
-            model="gpt-4.1",
-            input=f"""You are a helpful expert financial research assistant. Provide an example answer to the given question, that might be found in a document like an annual report.
 
-Question: {question}
+async def initialize_async(chroma_collection, cross_encoder=None, num_threads=None):
+    """
+    Async version of initialize; works with both async (HTTP) and in-process collections
+    """
+    _set_num_threads(num_threads)
+    await _query(chroma_collection, ["warmup"], 1)
+    await asyncio.to_thread(_warm_up_cross_encoder, cross_encoder)
 
-Generate a realistic, detailed answer that would typically appear in an annual report:"""
+
+def _set_num_threads(num_threads):
+    """Set torch's CPU thread count (default: half the cores)"""
+    import torch
+
+    torch.set_num_threads(num_threads or max(1, (os.cpu_count() or 1) // 2))
+
+
+def _warm_up_cross_encoder(cross_encoder):
+    """Prepare the cross-encoder and run one prediction, if given"""
+    if cross_encoder is not None:
+        optimize_cross_encoder(cross_encoder)
+        cross_encoder.predict([["warmup", "warmup"]], show_progress_bar=False)
+
+
+def _rerank_scores(cross_encoder, question, chunks):
+    """
+    Score each chunk against the question with the cross-encoder
+    Reuses cached (question, chunk) scores when CROSS_ENCODER_CACHE_ENABLED is set
+    Uncached pairs are scored in order of chunk length so each batch pads to similar lengths
+    Returns: np.ndarray of scores aligned with chunks
+    """
+    scores = np.empty(len(chunks), dtype=np.float32)
+    question_hash = hash(question)
+    keys = [(question_hash, hash(chunk)) for chunk in chunks]
+
+    if CROSS_ENCODER_CACHE_ENABLED:
+        with _cross_encoder_score_caches_lock:
+            if cross_encoder not in _cross_encoder_score_caches:
+                _cross_encoder_score_caches[cross_encoder] = _LRUCache(CROSS_ENCODER_CACHE_SIZE)
+            score_cache = _cross_encoder_score_caches[cross_encoder]
+
+        uncached = []
+        for i, key in enumerate(keys):
+            score = score_cache.get(key)
+            if score is None:
+                uncached.append(i)
+            else:
+                scores[i] = score
+    else:
+        score_cache = None
+        uncached = list(range(len(chunks)))
+
+    if uncached:
+        order = np.array(uncached)[np.argsort([len(chunks[i]) for i in uncached], kind="stable")]
+        pairs = [[question, chunks[i]] for i in order]
+        new_scores = cross_encoder.predict(
+            pairs, batch_size=CROSS_ENCODER_BATCH_SIZE, convert_to_numpy=True, show_progress_bar=False
         )
 
-        hypothetical_answer = hyp_response.output_text if hasattr(hyp_response, 'output_text') else str(hyp_response)
-        hypothetical_answer = hypothetical_answer.strip()
+        # Write back in original chunk order, undoing the length sort
+        scores[order] = new_scores
+        if score_cache is not None:
+            for i, score in zip(order, new_scores):
+                score_cache.put(keys[i], float(score))
 
-    except Exception as e:
-        # Fallback to original question if hypothetical generation fails
-        hypothetical_answer = ""
+    return scores
 
-    # Step 2: Create expanded query (original + hypothetical)
-    if hypothetical_answer:
-        expanded_query = f"{question} {hypothetical_answer}"
+
+def _drop_near_duplicates(embeddings, threshold):
+    """
+    Greedily keep each row unless its cosine similarity to an already kept row exceeds threshold
+    Returns: indices of the kept rows, in order
+    """
+    normalized = _normalize_rows(embeddings)
+    similarities = normalized @ normalized.T
+
+    kept = []
+    for i in range(len(normalized)):
+        if not kept or similarities[i, kept].max() <= threshold:
+            kept.append(i)
+    return kept
+
+
+def _top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, highest first
+    Uses argpartition (O(n)) and only sorts the k selected scores
+    """
+    scores = np.asarray(scores)
+    k = min(k, len(scores))
+    top_unsorted = np.argpartition(-scores, k - 1)[:k]
+    return top_unsorted[np.argsort(-scores[top_unsorted])]
+
+
+def _build_answer_prompt(question, chunks):
+    """
+    Final answer prompt: static instructions first, then retrieved chunks, then the question
+    Built with a single join, without an intermediate context string
+    """
+    parts = [STATIC_SYSTEM_PROMPT, "\n\nContext from TCS Annual Report:\n"]
+    for i, chunk in enumerate(chunks):
+        if i:
+            parts.append("\n\n")
+        parts.append(chunk)
+    parts.append("\n\nQuestion: ")
+    parts.append(question)
+    return "".join(parts)
+
+
+async def _query(chroma_collection, query_texts, n_results, include=None, query_embeddings=None):
+    """
+    Run a Chroma query: awaited directly for async (HTTP) collections, off the event loop for in-process ones
+    Precomputed query_embeddings, when given, are searched instead of embedding query_texts again
+    Only documents (and the always-returned ids) are fetched unless include says otherwise
+    """
+    kwargs = {"n_results": n_results, "include": include or ["documents"]}
+    if query_embeddings is not None:
+        kwargs["query_embeddings"] = query_embeddings
     else:
-        expanded_query = question
+        kwargs["query_texts"] = query_texts
+    if inspect.iscoroutinefunction(chroma_collection.query):
+        return await chroma_collection.query(**kwargs)
+    return await asyncio.to_thread(chroma_collection.query, **kwargs)
 
-    # Step 3: Retrieve 5 chunks using expanded query
-    results = chroma_collection.query(query_texts=[expanded_query], n_results=5)
 
-    if not results['documents'][0]:
-        runtime = time.time() - start_time
-        return {
-            "answer": "No relevant information found in TCS report.",
-            "runtime": round(runtime, 2),
-            "hypothetical_answer": hypothetical_answer
-        }
+async def connect_http_collection(collection_name, host="localhost", port=8000, embedding_function=None):
+    """
+    Connect to a collection on a Chroma server (`chroma run --path ./chroma_db`) with AsyncHttpClient.
+    The index then lives in the server process and queries from concurrent requests are served in parallel.
+    Defaults to the same SentenceTransformer embedding function as the notebooks.
+    HTTP collections are async-only: use them with the *_async / *_stream RAG functions and initialize_async.
+    Returns: AsyncCollection, usable as chroma_collection in the async RAG functions
+    """
+    import chromadb
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
 
-    # Step 4: Generate final answer using ONLY retrieved context (not hypothetical)
-    context = "\n\n".join(results['documents'][0])
+    chroma_client = await chromadb.AsyncHttpClient(host=host, port=port)
+    return await chroma_client.get_collection(
+        collection_name,
+        embedding_function=embedding_function or SentenceTransformerEmbeddingFunction()
+    )
 
-    try:
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=f"""Based on the following excerpts from the TCS Annual Report, please answer this question: {question}
 
-Context from TCS Annual Report:
-{context}
+def _normalize_rows(embeddings):
+    """Scale each row to unit length so inner product equals cosine similarity"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+class FaissCollection:
+    """
+    FAISS index over the chunks of a Chroma collection, usable in place of chroma_collection in the RAG functions.
+    Supports query(), count() and the collection's embedding function, with Chroma-shaped query results.
+    quantization=None keeps fp32 vectors in the index; "int8" uses 8-bit scalar quantization; "binary" searches
+    1-bit sign codes with Hamming distance and rescores the top rescore_candidates with fp32 inner product.
+    Requires faiss (`uv sync --extra faiss`).
+    """
+
+    def __init__(self, ids, documents, embeddings, embedding_function, metadatas=None,
+                 index_type="hnsw", quantization=None, hnsw_m=32, ef_construction=200, ef_search=64, nprobe=16,
+                 rescore_candidates=50):
+        import faiss
+
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.metadatas = list(metadatas) if metadatas is not None else [None] * len(self.documents)
+        self.quantization = quantization
+        self.rescore_candidates = rescore_candidates
+        self._embedding_function = embedding_function
+        self._embeddings = _normalize_rows(embeddings)
+        dimension = self._embeddings.shape[1]
+        # For IVF on larger corpora: sqrt(N) inverted lists, nprobe of them searched per query
+        nlist = max(1, int(np.sqrt(len(self.documents))))
+
+        if index_type not in ("hnsw", "ivf"):
+            raise ValueError(f"Unknown index_type: {index_type!r} (expected 'hnsw' or 'ivf')")
+
+        if quantization is None:
+            if index_type == "hnsw":
+                self.index = faiss.IndexHNSWFlat(dimension, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            else:
+                self.index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dimension), dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            vectors = self._embeddings
+        elif quantization == "int8":
+            if index_type == "hnsw":
+                self.index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            else:
+                self.index = faiss.IndexIVFScalarQuantizer(
+                    faiss.IndexFlatIP(dimension), dimension, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+                )
+            vectors = self._embeddings
+        elif quantization == "binary":
+            if dimension % 8:
+                raise ValueError(f"Binary quantization needs an embedding dimension divisible by 8, got {dimension}")
+            if index_type == "hnsw":
+                self.index = faiss.IndexBinaryHNSW(dimension, hnsw_m)
+            else:
+                self.index = faiss.IndexBinaryIVF(faiss.IndexBinaryFlat(dimension), dimension, nlist)
+            vectors = np.packbits(self._embeddings > 0, axis=1)
+        else:
+            raise ValueError(f"Unknown quantization: {quantization!r} (expected None, 'int8' or 'binary')")
+
+        if index_type == "hnsw":
+            self.index.hnsw.efConstruction = ef_construction
+            self.index.hnsw.efSearch = ef_search
+        else:
+            self.index.nprobe = nprobe
+
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add(vectors)
+
+    @classmethod
+    def from_chroma(cls, chroma_collection, **kwargs):
+        """Build a FAISS index from all chunks and stored embeddings of an existing Chroma collection"""
+        data = chroma_collection.get(include=["documents", "embeddings", "metadatas"])
+        return cls(
+            data['ids'],
+            data['documents'],
+            data['embeddings'],
+            chroma_collection._embedding_function,
+            metadatas=data['metadatas'],
+            **kwargs
+        )
 
-Please provide a clear, accurate answer based only on the information provided above. If the context doesn't contain enough information to fully answer the question, please say so."""
+    def count(self):
+        return len(self.documents)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, include=None):
+        """
+        Chroma-compatible query: search the index with query_embeddings, or with the embedded query_texts
+        Returns: {"ids": [[...]], plus one list per query for each included field}
+        """
+        include = include or ["metadatas", "documents", "distances"]
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(query_texts)
+        query_embeddings = _normalize_rows(query_embeddings)
+        if self.quantization == "binary":
+            _, candidates = self.index.search(
+                np.packbits(query_embeddings > 0, axis=1), max(n_results, self.rescore_candidates)
+            )
+            similarities, indices = self._rescore(query_embeddings, candidates, n_results)
+        else:
+            similarities, indices = self.index.search(query_embeddings, n_results)
+
+        results = {"ids": []}
+        for field in include:
+            results[field] = []
+
+        for row_similarities, row_indices in zip(similarities, indices):
+            found = row_indices >= 0  # FAISS pads with -1 when fewer than n_results are found
+            row_indices = row_indices[found]
+            results["ids"].append([self.ids[i] for i in row_indices])
+            if "documents" in include:
+                results["documents"].append([self.documents[i] for i in row_indices])
+            if "metadatas" in include:
+                results["metadatas"].append([self.metadatas[i] for i in row_indices])
+            if "embeddings" in include:
+                results["embeddings"].append(self._embeddings[row_indices])
+            if "distances" in include:
+                # Squared L2 distance between unit vectors, comparable to Chroma's default "l2" space
+                results["distances"].append((2 - 2 * row_similarities[found]).tolist())
+
+        return results
+
+    def _rescore(self, query_embeddings, candidates, n_results):
+        """
+        Re-rank binary search candidates by exact fp32 inner product
+        Returns: (similarities, indices), each (n_queries, n_results) and padded with -1 indices like FAISS
+        """
+        similarities = np.full((len(candidates), n_results), -np.inf, dtype=np.float32)
+        indices = np.full((len(candidates), n_results), -1, dtype=np.int64)
+
+        for row, (query_embedding, row_candidates) in enumerate(zip(query_embeddings, candidates)):
+            row_candidates = row_candidates[row_candidates >= 0]
+            if not len(row_candidates):
+                continue
+            candidate_similarities = self._embeddings[row_candidates] @ query_embedding
+            top = _top_k_indices(candidate_similarities, n_results)
+            similarities[row, :len(top)] = candidate_similarities[top]
+            indices[row, :len(top)] = row_candidates[top]
+
+        return similarities, indices
+
+
+def _check_sync_collection(chroma_collection, async_alternative):
+    """
+    Reject async (HTTP) collections in sync entry points. Every sync call runs on a new event loop, and
+    Chroma's async client keeps one HTTP client per loop that is never closed, so each call would leak one.
+    """
+    if inspect.iscoroutinefunction(chroma_collection.query):
+        raise TypeError(
+            f"Async Chroma collections are not supported by the sync functions; use {async_alternative} instead"
         )
 
-        answer = response.output_text if hasattr(response, 'output_text') else str(response)
-        runtime = time.time() - start_time
 
-        return {
-            "answer": answer.strip(),
-            "runtime": round(runtime, 2),
-            "hypothetical_answer": hypothetical_answer
-        }
+def _run(coro, chroma_collection):
+    """
+    Run a RAG coroutine to completion from sync code.
+    Works inside an already running event loop (e.g. Jupyter) by using a separate thread.
+    Raises TypeError for async (HTTP) collections, which must use the *_async / *_stream functions.
+    """
+    try:
+        _check_sync_collection(chroma_collection, "the *_async / *_stream functions")
+    except TypeError:
+        coro.close()
+        raise
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+async def _generate_hypothetical_answer(question, client):
+    """
+    Generate a hypothetical annual-report style answer to the question
+    Cached per normalized question when GENERATION_CACHE_ENABLED is set
+    Returns: hypothetical answer (str), empty if generation fails
+    """
+    key = _normalize_question(question)
+    cached = _hypothetical_answer_cache.get(key) if GENERATION_CACHE_ENABLED else None
+    if cached is not None:
+        return cached
+
+    try:
+        hypothetical_answer = await _create_response(
+            client,
+            f"""You are a helpful expert financial research assistant. Provide an example answer to the given question, that might be found in a document like an annual report.
+
+Question: {question}
+
+Generate a realistic, detailed answer that would typically appear in an annual report:"""
+        )
+        hypothetical_answer = hypothetical_answer.strip()
+        if GENERATION_CACHE_ENABLED:
+            _hypothetical_answer_cache.put(key, hypothetical_answer)
+        return hypothetical_answer
 
     except Exception as e:
-        runtime = time.time() - start_time
-        return {
-            "answer": f"Error calling OpenAI API: {str(e)}",
-            "runtime": round(runtime, 2),
-            "hypothetical_answer": hypothetical_answer
-        }
+        # Fallback to original question if hypothetical generation fails
+        return ""
 
 
-def multiple_queries_rag(question, chroma_collection, client, cross_encoder):
+async def _generate_related_queries(question, client):
     """
-    Multiple Queries RAG: generate 5 related questions, retrieve chunks, cross-encoder re-rank, take top 5
-    Returns: {"answer": str, "runtime": float, "generated_queries": list}
+    Generate 5 related questions to the original question
+    Cached per normalized question when GENERATION_CACHE_ENABLED is set
+    Returns: list of 5 questions, empty if generation fails
     """
-    start_time = time.time()
+    key = _normalize_question(question)
+    cached = _related_queries_cache.get(key) if GENERATION_CACHE_ENABLED else None
+    if cached is not None:
+        return list(cached)
 
-    # Step 1: Generate 5 related questions
     try:
-        queries_response = client.responses.create(
-            model="gpt-4.1",
-            input=f"""You are a helpful expert financial research assistant. Your users are asking questions about the TCS Annual Report.
+        content = await _create_response(
+            client,
+            f"""You are a helpful expert financial research assistant. Your users are asking questions about the TCS Annual Report.
 
 Suggest up to 5 additional related questions to help them find the information they need, for the provided question.
 Suggest only short questions without compound sentences. Suggest a variety of questions that cover different aspects of the topic.
@@ -146,8 +710,6 @@ Original question: {question}
 
 Generate 5 related questions:"""
         )
-
-        content = queries_response.output_text if hasattr(queries_response, 'output_text') else str(queries_response)
         generated_queries = [q.strip() for q in content.split("\n") if q.strip()]
 
         # Ensure we have exactly 5 questions
@@ -157,73 +719,215 @@ Generate 5 related questions:"""
             while len(generated_queries) < 5:
                 generated_queries.append(generated_queries[0] if generated_queries else question)
 
+        if GENERATION_CACHE_ENABLED:
+            _related_queries_cache.put(key, tuple(generated_queries))
+        return generated_queries
+
     except Exception as e:
-        generated_queries = []
+        return []
+
+
+async def basic_rag_stream(question, chroma_collection, client):
+    """
+    Basic RAG: retrieve 5 chunks, stream answer from LLM_MODEL
+    Returns: (async iterator of answer text chunks, future resolving to {"answer": str, "runtime": float})
+    """
+    start_time = time.perf_counter()
+
+    # Reuse the answer to a semantically equivalent question if we have one
+    answer_cache = _answer_cache(chroma_collection, "basic_rag")
+    question_embedding = await _embed_question(chroma_collection, question) if SEMANTIC_CACHE_ENABLED else None
+    if question_embedding is not None:
+        cached = answer_cache.get(question_embedding)
+        if cached is not None:
+            return _cached_answer(cached, start_time)
+
+    # Retrieve 5 most relevant chunks
+    results = await _query(
+        chroma_collection, [question], 5,
+        query_embeddings=[question_embedding] if question_embedding is not None else None
+    )
+
+    if not results['documents'][0]:
+        return _stream_text("No relevant information found in TCS report.", start_time, {})
+
+    # Stream answer from LLM_MODEL
+    return _stream_answer(
+        client,
+        _build_answer_prompt(question, results['documents'][0]),
+        start_time,
+        {},
+        on_success=_cache_answer(answer_cache, question_embedding)
+    )
+
+
+async def query_expansion_rag_stream(question, chroma_collection, client):
+    """
+    Query Expansion RAG: generate hypothetical answer, combine with question, retrieve 5 chunks, stream answer
+    Returns: (async iterator of answer text chunks, future resolving to {"answer": str, "runtime": float, "hypothetical_answer": str})
+    """
+    start_time = time.perf_counter()
+
+    # Reuse the answer to a semantically equivalent question if we have one
+    answer_cache = _answer_cache(chroma_collection, "query_expansion_rag")
+    question_embedding = await _embed_question(chroma_collection, question) if SEMANTIC_CACHE_ENABLED else None
+    if question_embedding is not None:
+        cached = answer_cache.get(question_embedding)
+        if cached is not None:
+            return _cached_answer(cached, start_time)
+
+    # Step 1: Generate hypothetical answer
+    hypothetical_answer = await _generate_hypothetical_answer(question, client)
+
+    # Step 2: Create expanded query (original + hypothetical)
+    if hypothetical_answer:
+        expanded_query = f"{question} {hypothetical_answer}"
+    else:
+        expanded_query = question
+
+    # Step 3: Retrieve 5 chunks using expanded query
+    results = await _query(chroma_collection, [expanded_query], 5)
+
+    metadata = {"hypothetical_answer": hypothetical_answer}
+    if not results['documents'][0]:
+        return _stream_text("No relevant information found in TCS report.", start_time, metadata)
+
+    # Step 4: Stream final answer using ONLY retrieved context (not hypothetical)
+    return _stream_answer(
+        client,
+        _build_answer_prompt(question, results['documents'][0]),
+        start_time,
+        metadata,
+        on_success=_cache_answer(answer_cache, question_embedding)
+    )
+
 
-    # Step 2: Create list of all queries (original + 5 related)
-    all_queries = [question] + generated_queries
+async def multiple_queries_rag_stream(question, chroma_collection, client, cross_encoder):
+    """
+    Multiple Queries RAG: generate 5 related questions, retrieve chunks, cross-encoder re-rank, take top 5, stream answer
+    Returns: (async iterator of answer text chunks, future resolving to {"answer": str, "runtime": float, "generated_queries": list})
+    """
+    start_time = time.perf_counter()
+
+    # Reuse the answer to a semantically equivalent question if we have one
+    answer_cache = _answer_cache(chroma_collection, "multiple_queries_rag")
+    question_embedding = await _embed_question(chroma_collection, question) if SEMANTIC_CACHE_ENABLED else None
+    if question_embedding is not None:
+        cached = answer_cache.get(question_embedding)
+        if cached is not None:
+            return _cached_answer(cached, start_time)
+
+    include = ["documents", "embeddings"]
+
+    async def retrieve(query_texts, query_embeddings=None):
+        # Returns (ids, documents, embeddings) per query
+        try:
+            results = await _query(chroma_collection, query_texts, RESULTS_PER_QUERY, include, query_embeddings)
+            return list(zip(results['ids'], results['documents'], results['embeddings']))
+        except Exception as e:
+            return [([], [], []) for _ in query_texts]
+
+    # Step 1: Generate 5 related questions while retrieving chunks for the original question
+    generated_queries, original_results = await asyncio.gather(
+        _generate_related_queries(question, client),
+        retrieve([question], [question_embedding] if question_embedding is not None else None)
+    )
 
-    # Step 3: Retrieve chunks from all queries and deduplicate
-    all_chunks = []
-    for query in all_queries:
+    # Step 2: Retrieve chunks for the related queries in one batched call
+    results_list = list(original_results)
+    if generated_queries:
         try:
-            results = chroma_collection.query(query_texts=[query], n_results=10)  # Get more for better cross-encoder selection
-            if results['documents'][0]:
-                all_chunks.extend(results['documents'][0])
+            results = await _query(chroma_collection, generated_queries, RESULTS_PER_QUERY, include)
+            results_list.extend(zip(results['ids'], results['documents'], results['embeddings']))
         except Exception as e:
-            continue
+            # Fall back to one query per request so a single failing query only drops its own chunks
+            per_query = await asyncio.gather(*(retrieve([query]) for query in generated_queries))
+            for query_results in per_query:
+                results_list.extend(query_results)
+
+    # Step 3: Deduplicate chunks by Chroma id (dict keeps first-seen order), then drop near-duplicates
+    chunks_by_id = {}
+    for ids, docs, embeddings in results_list:
+        for chunk_id, chunk, embedding in zip(ids, docs, embeddings):
+            chunks_by_id.setdefault(chunk_id, (chunk, embedding))
 
-    # Step 4: Deduplicate chunks using exact string matching
     unique_chunks = []
-    seen_chunks = set()
-    for chunk in all_chunks:
-        if chunk not in seen_chunks:
-            unique_chunks.append(chunk)
-            seen_chunks.add(chunk)
+    if chunks_by_id:
+        chunks, embeddings = zip(*chunks_by_id.values())
+        unique_chunks = [chunks[i] for i in _drop_near_duplicates(np.stack(embeddings), NEAR_DUPLICATE_THRESHOLD)]
 
+    metadata = {"generated_queries": generated_queries}
     if not unique_chunks:
-        runtime = time.time() - start_time
-        return {
-            "answer": "No relevant information found in TCS report.",
-            "runtime": round(runtime, 2),
-            "generated_queries": generated_queries
-        }
-
-    # Step 5: Cross-encoder re-ranking - score all chunks against original question
-    pairs = [[question, chunk] for chunk in unique_chunks]
-    scores = cross_encoder.predict(pairs)
-
-    # Step 6: Get top 5 highest scoring chunks
-    top_indices = np.argsort(scores)[::-1][:5]  # Top 5 indices
+        return _stream_text("No relevant information found in TCS report.", start_time, metadata)
+
+    # Step 4: Cross-encoder re-ranking - score all chunks against original question
+    scores = await asyncio.to_thread(_rerank_scores, cross_encoder, question, unique_chunks)
+
+    # Step 5: Get top 5 highest scoring chunks, penalizing length slightly to offset the cross-encoder's length bias
+    lengths = np.fromiter((len(chunk) for chunk in unique_chunks), dtype=np.int32, count=len(unique_chunks))
+    adjusted_scores = scores - LENGTH_PENALTY * np.log1p(lengths)
+    top_indices = _top_k_indices(adjusted_scores, 5)
     top_chunks = [unique_chunks[i] for i in top_indices]
 
-    # Step 7: Generate final answer using top 5 re-ranked chunks
-    context = "\n\n".join(top_chunks)
+    # Step 6: Stream final answer using top 5 re-ranked chunks
+    return _stream_answer(
+        client,
+        _build_answer_prompt(question, top_chunks),
+        start_time,
+        metadata,
+        on_success=_cache_answer(answer_cache, question_embedding)
+    )
 
-    try:
-        response = client.responses.create(
-            model="gpt-4.1",
-            input=f"""Based on the following excerpts from the TCS Annual Report, please answer this question: {question}
 
-Context from TCS Annual Report:
-{context}
+async def basic_rag_async(question, chroma_collection, client):
+    """
+    Basic RAG: retrieve 5 chunks, generate answer with LLM_MODEL
+    Async version; client may be AsyncOpenAI or OpenAI
+    Returns: {"answer": str, "runtime": float}
+    """
+    return await _collect(*await basic_rag_stream(question, chroma_collection, client))
 
-Please provide a clear, accurate answer based only on the information provided above. If the context doesn't contain enough information to fully answer the question, please say so."""
-        )
 
-        answer = response.output_text if hasattr(response, 'output_text') else str(response)
-        runtime = time.time() - start_time
+async def query_expansion_rag_async(question, chroma_collection, client):
+    """
+    Query Expansion RAG: generate hypothetical answer, combine with question, retrieve 5 chunks
+    Async version; client may be AsyncOpenAI or OpenAI
+    Returns: {"answer": str, "runtime": float, "hypothetical_answer": str}
+    """
+    return await _collect(*await query_expansion_rag_stream(question, chroma_collection, client))
 
-        return {
-            "answer": answer.strip(),
-            "runtime": round(runtime, 2),
-            "generated_queries": generated_queries
-        }
 
-    except Exception as e:
-        runtime = time.time() - start_time
-        return {
-            "answer": f"Error calling OpenAI API: {str(e)}",
-            "runtime": round(runtime, 2),
-            "generated_queries": generated_queries
-        }
\ No newline at end of file
+async def multiple_queries_rag_async(question, chroma_collection, client, cross_encoder):
+    """
+    Multiple Queries RAG: generate 5 related questions, retrieve chunks, cross-encoder re-rank, take top 5
+    Async version; client may be AsyncOpenAI or OpenAI
+    Returns: {"answer": str, "runtime": float, "generated_queries": list}
+    """
+    return await _collect(*await multiple_queries_rag_stream(question, chroma_collection, client, cross_encoder))
+
+
+def basic_rag(question, chroma_collection, client):
+    """
+    Basic RAG: retrieve 5 chunks, generate answer with LLM_MODEL
+    Sync wrapper around basic_rag_async
+    Returns: {"answer": str, "runtime": float}
+    """
+    return _run(basic_rag_async(question, chroma_collection, client), chroma_collection)
+
+
+def query_expansion_rag(question, chroma_collection, client):
+    """
+    Query Expansion RAG: generate hypothetical answer, combine with question, retrieve 5 chunks
+    Sync wrapper around query_expansion_rag_async
+    Returns: {"answer": str, "runtime": float, "hypothetical_answer": str}
+    """
+    return _run(query_expansion_rag_async(question, chroma_collection, client), chroma_collection)
+
+
+def multiple_queries_rag(question, chroma_collection, client, cross_encoder):
+    """
+    Multiple Queries RAG: generate 5 related questions, retrieve chunks, cross-encoder re-rank, take top 5
+    Sync wrapper around multiple_queries_rag_async
+    Returns: {"answer": str, "runtime": float, "generated_queries": list}
+    """
+    return _run(multiple_queries_rag_async(question, chroma_collection, client, cross_encoder), chroma_collection)